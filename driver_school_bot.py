@@ -23,14 +23,26 @@
 # - No Markdown parse issues (plain text messages)
 
 import os
+import io
+import re
+import csv
 import json
+import asyncio
+import bisect
+import functools
 from datetime import datetime, date, timedelta, time
 from pathlib import Path
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, FrozenSet, Iterable, List, Optional, Tuple
 
 from zoneinfo import ZoneInfo
 
+try:
+    import orjson  # optional: much faster JSON, falls back to json
+except ImportError:
+    orjson = None
+
 from telegram import (
+    Bot,
     Update,
     InputFile,
     ReplyKeyboardMarkup,
@@ -47,16 +59,28 @@ from telegram.ext import (
 # ---------- Constants ----------
 
 DATA_FILE = Path("driver_school_data.json")
+TRIPS_FILE = Path("driver_school_trips.jsonl")  # append-only, one trip per line
+PAYMENTS_FILE = Path("driver_school_payments.jsonl")  # append-only, one payment per line
 DUBAI_TZ = ZoneInfo("Asia/Dubai")
 
+DATA_SCHEMA_VERSION = 5  # bump when the upgrade in load_data changes
+
 DEFAULT_BASE_WEEKLY = 725.0  # AED
 SCHOOL_DAYS_PER_WEEK = 5
 
 # Admins (family) — Telegram user IDs
-ALLOWED_ADMINS = [
+ALLOWED_ADMINS: FrozenSet[int] = frozenset({
     7698278415,  # Faisal
     5034920293,  # Abdulla
-]
+})
+
+# Admin quick trip text, e.g. "70 Dubai Mall" → (amount, destination)
+QUICK_TRIP_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s+(.+)$")
+
+# Trip detail line in reports / unpaid lists (bound .format, parsed once)
+TRIP_LINE_FMT = "- ID {id}: {d} — {dest} — {amt:.2f} AED".format
+TRIP_LINE_DRIVER_FMT = "- ID {id}: {d} — {dest} — {amt:.2f} AED (driver: {drv})".format
+REPORT_TEXT_BUDGET = 3900  # detail lines stop here; leaves room for footers under Telegram's 4096
 
 # Buttons — Admin main menu
 BTN_ADD_TRIP = "➕ Add Trip"
@@ -88,11 +112,68 @@ BTN_DRIVER_MY_REPORT = "🧾 My Weekly Report"
 
 # ---------- Data helpers ----------
 
+def json_bytes(obj: Any) -> bytes:
+    """Compact UTF-8 JSON (no indent, no spaces after separators)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_parse(raw: Any) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+# In-process copy of the data. Handlers share and mutate this one dict;
+# it is re-read only when a file changes on disk behind our back.
+_DATA_CACHE: Dict[str, Any] = {
+    "key": None,     # data_files_key() when "data" was read / last written
+    "data": None,
+    "dirty": False,  # changed in memory, flush pending
+    "flush": None,   # pending flush task
+}
+SAVE_DEBOUNCE_SECONDS = 0.2  # saves within this window become one write
+
+
+def data_files_key() -> Tuple[Optional[Tuple[int, int]], ...]:
+    key = []
+    for path in (DATA_FILE, TRIPS_FILE, PAYMENTS_FILE):
+        try:
+            st = path.stat()
+        except OSError:
+            key.append(None)
+            continue
+        key.append((st.st_mtime_ns, st.st_size))
+    return tuple(key)
+
+
+def cached_data() -> Optional[Dict[str, Any]]:
+    data = _DATA_CACHE["data"]
+    if data is None:
+        return None
+    # Unflushed changes win over whatever is on disk
+    if _DATA_CACHE["dirty"] or _DATA_CACHE["key"] == data_files_key():
+        return data
+    return None
+
+
 def load_data() -> Dict[str, Any]:
+    data = cached_data()
+    if data is None:
+        data = read_data()
+        _DATA_CACHE["data"] = data
+        _DATA_CACHE["key"] = data_files_key()
+    return data
+
+
+def read_data() -> Dict[str, Any]:
+    """
+    Read the files from disk and upgrade / index the result. See load_data.
+    """
     if DATA_FILE.exists():
         try:
-            with DATA_FILE.open("r", encoding="utf-8") as f:
-                data = json.load(f)
+            data = json_parse(DATA_FILE.read_bytes())
         except Exception:
             data = {}
     else:
@@ -101,9 +182,25 @@ def load_data() -> Dict[str, Any]:
     if not isinstance(data, dict):
         data = {}
 
+    # Trips live in TRIPS_FILE; older data files keep them inside DATA_FILE.
+    # While DATA_FILE still has its list it wins over TRIPS_FILE (which may be
+    # a stray or half-written copy); only later ids are taken from the log.
+    legacy_trips = data.pop("trips", None)
+    logged_trips: List[Dict[str, Any]] = []
+    if TRIPS_FILE.exists():
+        repair_jsonl_tail(TRIPS_FILE)
+        logged_trips = read_jsonl(TRIPS_FILE)
+    if isinstance(legacy_trips, list):
+        last_id = max((t.get("id", 0) for t in legacy_trips), default=0)
+        data["trips"] = legacy_trips + [t for t in logged_trips if t.get("id", 0) > last_id]
+    else:
+        data["trips"] = logged_trips
+    # Invariant: data["trips"] is sorted by id ascending. add_trip_common only
+    # appends with next_trip_id, so this sort matters for old files only.
+    data["trips"].sort(key=lambda t: t.get("id", 0))
+
     data.setdefault("base_weekly", DEFAULT_BASE_WEEKLY)
     data.setdefault("week_start_date", None)      # "YYYY-MM-DD" or None
-    data.setdefault("trips", [])                  # list of trip dicts
     data.setdefault("next_trip_id", 1)
     data.setdefault("no_school_dates", [])        # list of "YYYY-MM-DD"
     data.setdefault("drivers", {})                # {str(telegram_id): {...}}
@@ -111,24 +208,311 @@ def load_data() -> Dict[str, Any]:
     data.setdefault("test_mode", False)
     data.setdefault("awaiting_noschool_date", []) # list of admin chat_ids awaiting date
 
-    # Upgrade old driver structure with new fields
-    drivers = data["drivers"]
-    for drv in drivers.values():
-        drv.setdefault("active", True)
-        drv.setdefault("is_primary", False)
-        drv.setdefault("base_weekly", None)   # per-driver base; None -> use global
-        drv.setdefault("payments", [])        # list of ISO timestamps
-        drv.setdefault("short_id", None)      # small int
+    # Payments live in PAYMENTS_FILE; older data files keep them inside DATA_FILE.
+    # Those win as well, plus any logged checkpoint they don't have yet.
+    logged_payments: List[Dict[str, Any]] = []
+    if PAYMENTS_FILE.exists():
+        repair_jsonl_tail(PAYMENTS_FILE)
+        logged_payments = read_jsonl(PAYMENTS_FILE)
+    if any("payments" in drv for drv in data["drivers"].values()):
+        records = payment_records(data["drivers"])
+        seen = {(r["d"], r["t"]) for r in records}
+        records += [r for r in logged_payments if (r.get("d"), r.get("t")) not in seen]
+        replay_payments(data["drivers"], records)
+    elif logged_payments:
+        replay_payments(data["drivers"], logged_payments)
+
+    # Trips are appended before the (debounced) main file is saved; never reuse an id
+    if data["trips"]:
+        data["next_trip_id"] = max(data["next_trip_id"], max(t.get("id", 0) for t in data["trips"]) + 1)
+
+    # Upgrade old driver / trip structure with new fields (once; then saved with the version)
+    if data.get("schema_version") != DATA_SCHEMA_VERSION:
+        drivers = data["drivers"]
+        for drv in drivers.values():
+            drv.setdefault("active", True)
+            drv.setdefault("is_primary", False)
+            drv.setdefault("base_weekly", None)   # per-driver base; None -> use global
+            drv.setdefault("payments", [])        # list of ISO timestamps
+            drv.setdefault("short_id", None)      # small int
+            if "paid_up_to_ts" not in drv:        # max(payments) as float epoch seconds
+                drv["paid_up_to_ts"] = scan_last_payment_ts(drv)
+        for t in data["trips"]:
+            if "ts" not in t:                     # trip date as float epoch seconds
+                try:
+                    t["ts"] = parse_trip_datetime(t["date"]).timestamp()
+                except Exception:
+                    t["ts"] = None
+        # Trips/payments files first, then drop them from DATA_FILE. If a log
+        # can't be written, DATA_FILE keeps everything and the next load retries.
+        if write_trips(data["trips"]) and write_payments(payment_records(drivers)):
+            data["schema_version"] = DATA_SCHEMA_VERSION
+            save_data(data)
+        else:
+            data["_logs_in_data_file"] = True
+
+    # In-memory only: no-school dates as date objects ("_" keys are not saved)
+    data["_no_school_set"] = build_no_school_set(data["no_school_dates"])
+    refresh_no_school_ranges(data)
+    build_trip_indexes(data)
+    build_sid_index(data)
 
     return data
 
 
 def save_data(data: Dict[str, Any]) -> None:
+    """
+    Save everything except trips and payments (see append_trip / append_payments).
+    Top-level keys starting with "_" are derived in load_data, never persisted.
+    """
+    raw = dump_data(data)
+    if raw is not None:
+        write_data_bytes(raw)
+
+
+def dump_data(data: Dict[str, Any]) -> Optional[bytes]:
+    payload = {k: v for k, v in data.items() if not k.startswith("_") and k != "trips"}
+    payload["drivers"] = {
+        key: {f: v for f, v in drv.items() if f not in PAYMENT_FIELDS}
+        for key, drv in data.get("drivers", {}).items()
+    }
+    if data.get("_logs_in_data_file"):  # upgrade not done yet, see read_data
+        payload["trips"] = data["trips"]
+        payload["drivers"] = data.get("drivers", {})
+    try:
+        return json_bytes(payload)
+    except Exception:
+        return None
+
+
+def write_data_bytes(raw: bytes) -> None:
+    replace_file_bytes(DATA_FILE, raw)
+    _DATA_CACHE["key"] = data_files_key()  # our own write: cache is still current
+
+
+def replace_file_bytes(path: Path, raw: bytes) -> bool:
+    """
+    Write to a temp file and rename it over `path`, so a crash mid-write
+    leaves the previous file intact instead of a truncated one.
+    Returns False if the write failed.
+    """
+    tmp = path.with_name(path.name + ".tmp")
     try:
-        with DATA_FILE.open("w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with tmp.open("wb") as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())  # one fsync per (debounced) save, before the rename
+        os.replace(tmp, path)
+    except Exception:
+        return False
+    return True
+
+
+# Handlers run on the asyncio loop, so their disk IO goes to a worker thread.
+_FILE_IO_LOCK = asyncio.Lock()
+
+
+async def run_file_io(fn, *args):
+    """
+    Run blocking file IO in a thread, one call at a time in call order:
+    a load never sees a half-written file and saves land in order.
+    """
+    async with _FILE_IO_LOCK:
+        return await asyncio.to_thread(fn, *args)
+
+
+async def load_data_async() -> Dict[str, Any]:
+    data = cached_data()
+    if data is not None:
+        return data
+    return await run_file_io(load_data)
+
+
+async def load_update_data(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Dict[str, Any]:
+    """
+    load_data_async once per update: menu buttons call command handlers and
+    /trip calls add_trip_common, and those reuse the data stashed here.
+    """
+    chat_data = context.chat_data
+    stash = chat_data.get("_data") if chat_data is not None else None
+    if stash is not None and stash[0] == update.update_id:
+        return stash[1]
+    data = await load_data_async()
+    if chat_data is not None:
+        chat_data["_data"] = (update.update_id, data)
+    return data
+
+
+async def save_data_async(data: Dict[str, Any]) -> None:
+    """
+    Mark data dirty and flush it SAVE_DEBOUNCE_SECONDS later, so a burst of
+    handler saves (e.g. several quick trips in a row) costs one write.
+    Only for changes that survive a kill before the flush: trips are already
+    in TRIPS_FILE (next_trip_id is rebuilt from them). Anything confirmed to
+    the admin uses save_data_now.
+    """
+    _DATA_CACHE["data"] = data
+    _DATA_CACHE["dirty"] = True
+    if _DATA_CACHE["flush"] is None:
+        _DATA_CACHE["flush"] = asyncio.create_task(flush_data_later())
+
+
+async def save_data_now(data: Dict[str, Any]) -> None:
+    """
+    Write before the handler replies. Render stops the bot with SIGTERM and
+    polling ignores signals, so a debounced save could be lost after the
+    admin was told the change was done.
+    """
+    _DATA_CACHE["data"] = data
+    _DATA_CACHE["dirty"] = True
+    await flush_data()
+
+
+async def flush_data_later() -> None:
+    await asyncio.sleep(SAVE_DEBOUNCE_SECONDS)
+    _DATA_CACHE["flush"] = None
+    await flush_data()
+
+
+async def flush_data() -> None:
+    if not _DATA_CACHE["dirty"]:
+        return
+    _DATA_CACHE["dirty"] = False
+    # Serialize on the loop (data may change once we yield); only the write is threaded
+    raw = dump_data(_DATA_CACHE["data"])
+    if raw is not None:
+        await run_file_io(write_data_bytes, raw)
+
+
+def read_jsonl(path: Path) -> List[Dict[str, Any]]:
+    """
+    Read a JSON-lines file. Lines that don't parse are skipped.
+    """
+    rows: List[Dict[str, Any]] = []
+    try:
+        with path.open("rb") as f:
+            for line in f:
+                try:
+                    row = json_parse(line)
+                except ValueError:
+                    continue
+                if isinstance(row, dict):
+                    rows.append(row)
     except Exception:
         pass
+    return rows
+
+
+def repair_jsonl_tail(path: Path) -> None:
+    """
+    Run on load, before anything is appended: a crash mid-append can leave a
+    last line without its newline, and the next record would be glued onto it
+    (both then fail to parse). A complete record gets its newline back, a torn
+    one is cut off.
+    """
+    try:
+        with path.open("r+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            f.seek(0)
+            raw = f.read()
+            end = raw.rfind(b"\n") + 1
+            try:
+                whole = isinstance(json_parse(raw[end:]), dict)
+            except ValueError:
+                whole = False
+            if whole:
+                f.write(b"\n")
+            else:
+                f.truncate(end)
+    except Exception:
+        pass
+
+
+def append_trip(trip: Dict[str, Any]) -> None:
+    try:
+        with TRIPS_FILE.open("ab") as f:
+            f.write(json_bytes(trip) + b"\n")
+    except Exception:
+        pass
+    _DATA_CACHE["key"] = data_files_key()
+
+
+def write_trips(trips: List[Dict[str, Any]]) -> bool:
+    """
+    Full rewrite of TRIPS_FILE — only for migration and /cleartrips.
+    """
+    try:
+        ok = replace_file_bytes(TRIPS_FILE, b"".join(json_bytes(t) + b"\n" for t in trips))
+    except Exception:
+        ok = False
+    _DATA_CACHE["key"] = data_files_key()
+    return ok
+
+
+# Driver fields rebuilt from PAYMENTS_FILE on load and left out of DATA_FILE
+PAYMENT_FIELDS = ("payments", "paid_up_to_ts")
+
+
+def replay_payments(drivers: Dict[str, Any], records: List[Dict[str, Any]]) -> None:
+    """
+    Rebuild each driver's 'payments' / 'paid_up_to_ts' from the payments log.
+    Records of drivers that no longer exist are ignored.
+    """
+    for drv in drivers.values():
+        drv["payments"] = []
+        drv["paid_up_to_ts"] = None
+    for rec in records:
+        drv = drivers.get(str(rec.get("d")))
+        if not drv:
+            continue
+        drv["payments"].append(rec.get("t"))
+        ts = rec.get("ts")
+        if ts is not None and (drv["paid_up_to_ts"] is None or ts > drv["paid_up_to_ts"]):
+            drv["paid_up_to_ts"] = ts
+
+
+def append_payments(records: List[Dict[str, Any]]) -> None:
+    """
+    One write for a whole checkpoint (/paid covers every driver). Records
+    are {"d": driver_id, "t": ISO timestamp, "ts": float epoch seconds}.
+    """
+    try:
+        with PAYMENTS_FILE.open("ab") as f:
+            f.write(b"".join(json_bytes(r) + b"\n" for r in records))
+    except Exception:
+        pass
+    _DATA_CACHE["key"] = data_files_key()
+
+
+def payment_records(drivers: Dict[str, Any]) -> List[Dict[str, Any]]:
+    records = []
+    for drv in drivers.values():
+        for iso in drv.get("payments", []):
+            try:
+                ts = parse_iso_datetime(iso).timestamp()
+            except Exception:
+                ts = None
+            records.append({"d": drv["id"], "t": iso, "ts": ts})
+    return records
+
+
+def write_payments(records: List[Dict[str, Any]]) -> bool:
+    """
+    Full rewrite of PAYMENTS_FILE — only for migration and /removedriver
+    (so a re-added driver doesn't inherit old payments). On failure the old
+    file is left as it was.
+    """
+    try:
+        ok = replace_file_bytes(PAYMENTS_FILE, b"".join(json_bytes(r) + b"\n" for r in records))
+    except Exception:
+        ok = False
+    _DATA_CACHE["key"] = data_files_key()
+    return ok
 
 
 def today_dubai() -> date:
@@ -139,22 +523,112 @@ def now_dubai() -> datetime:
     return datetime.now(DUBAI_TZ)
 
 
+# Pure and called with a handful of recent dates, so both are memoized
+@functools.lru_cache(maxsize=256)
 def parse_date_str(d: str) -> date:
     return datetime.strptime(d, "%Y-%m-%d").date()
 
 
+@functools.lru_cache(maxsize=1024)
 def format_date(d: date) -> str:
-    return d.strftime("%Y-%m-%d")
+    return d.isoformat()  # YYYY-MM-DD, same as strftime("%Y-%m-%d")
+
+
+def format_minute(dt: datetime) -> str:
+    """YYYY-MM-DD HH:MM from the fields; no strftime format parsing."""
+    return f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d} {dt.hour:02d}:{dt.minute:02d}"
 
 
 def parse_iso_datetime(dt: str) -> datetime:
     return datetime.fromisoformat(dt)
 
 
+@functools.lru_cache(maxsize=4096)
+def parse_trip_datetime(dt: str) -> datetime:
+    """
+    Trip dates are saved from now_dubai().isoformat(), so they already carry
+    the Dubai offset and need no astimezone(). Legacy naive strings are Dubai.
+    Cached: list/report loops parse the same strings on every call.
+    """
+    parsed = datetime.fromisoformat(dt)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=DUBAI_TZ)
+    return parsed
+
+
+def build_no_school_set(no_school_dates: List[str]) -> FrozenSet[date]:
+    result = set()
+    for s in no_school_dates:
+        try:
+            result.add(parse_date_str(s))
+        except Exception:
+            continue
+    return frozenset(result)
+
+
+def dates_to_ranges(sorted_dates: List[date]) -> List[Tuple[date, date]]:
+    """
+    Collapse sorted dates into (start, end) pairs of consecutive days.
+    e.g. [1, 2, 3, 7] → [(1, 3), (7, 7)]
+    """
+    ranges: List[Tuple[date, date]] = []
+    for d in sorted_dates:
+        if ranges and d == ranges[-1][1] + timedelta(days=1):
+            ranges[-1] = (ranges[-1][0], d)
+        elif not ranges or d > ranges[-1][1]:
+            ranges.append((d, d))
+    return ranges
+
+
+def refresh_no_school_ranges(data: Dict[str, Any]) -> None:
+    """
+    Rebuild data['_no_school_ranges'] from data['_no_school_set'].
+    Call after every change to the no-school set.
+    """
+    data["_no_school_ranges"] = dates_to_ranges(sorted(data["_no_school_set"]))
+
+
+def build_trip_indexes(data: Dict[str, Any]) -> None:
+    """
+    Derived trip state, kept current by index_trip():
+    - _real_trips_by_driver / _real_trip_ts_by_driver / _real_trip_amount_by_driver:
+      per-driver REAL trips ordered by 'ts', plus parallel ts (for bisect) and
+      amount (for slice sums) lists. TEST trips and trips without a ts are
+      left out; every reader skips them anyway.
+    - _real_total / _test_total: running amount sums split by is_test, for /list
+    """
+    data["_real_trips_by_driver"] = {}
+    data["_real_trip_ts_by_driver"] = {}
+    data["_real_trip_amount_by_driver"] = {}
+    data["_real_total"] = 0.0
+    data["_test_total"] = 0.0
+    for t in data["trips"]:
+        index_trip(data, t)
+
+
+def index_trip(data: Dict[str, Any], trip: Dict[str, Any]) -> None:
+    if trip.get("is_test", False):
+        data["_test_total"] += trip["amount"]
+        return
+    data["_real_total"] += trip["amount"]
+
+    ts = trip.get("ts")
+    if ts is None:
+        return
+    driver_id = trip.get("driver_id")
+    trips = data["_real_trips_by_driver"].setdefault(driver_id, [])
+    ts_list = data["_real_trip_ts_by_driver"].setdefault(driver_id, [])
+    amounts = data["_real_trip_amount_by_driver"].setdefault(driver_id, [])
+    pos = bisect.bisect_right(ts_list, ts)
+    ts_list.insert(pos, ts)
+    trips.insert(pos, trip)
+    amounts.insert(pos, trip["amount"])
+
+
 # ---------- Auth helpers ----------
 
 def is_admin(user_id: Optional[int]) -> bool:
-    return user_id in ALLOWED_ADMINS if user_id is not None else False
+    return user_id in ALLOWED_ADMINS
 
 
 def is_driver_user(data: Dict[str, Any], user_id: Optional[int]) -> bool:
@@ -202,14 +676,37 @@ def get_driver_by_any_id(data: Dict[str, Any], code: int) -> Optional[Dict[str,
         return drv
 
     # 2) Try as short_id
-    for d in drivers.values():
-        if d.get("short_id") == code:
-            return d
+    driver_id = data["_sid_to_id"].get(code)
+    if driver_id is None:
+        return None
+    return drivers.get(str(driver_id))
 
-    return None
+
+def build_sid_index(data: Dict[str, Any]) -> None:
+    """
+    In-memory {short_id: telegram_id} for get_driver_by_any_id. Rebuilt on load
+    and whenever a driver is added or removed.
+    """
+    sid_to_id: Dict[int, int] = {}
+    for d in data.get("drivers", {}).values():
+        sid = d.get("short_id")
+        if sid is not None:
+            sid_to_id.setdefault(sid, d["id"])  # first match wins, like the old scan
+    data["_sid_to_id"] = sid_to_id
 
 
 def get_primary_driver(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Cached in data['_primary_driver'] (a 1-tuple, so "no driver" is cached
+    too) until a driver command calls invalidate_driver_caches().
+    """
+    cached = data.get("_primary_driver")
+    if cached is None:
+        cached = data["_primary_driver"] = (find_primary_driver(data),)
+    return cached[0]
+
+
+def find_primary_driver(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     drivers = data.get("drivers", {})
     for d in drivers.values():
         if d.get("active", True) and d.get("is_primary", False):
@@ -221,6 +718,22 @@ def get_primary_driver(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
 
 
 def drivers_list_text(data: Dict[str, Any]) -> str:
+    """
+    Rendered once and kept in data['_drivers_list_text'] until a driver
+    command calls invalidate_driver_caches().
+    """
+    cached = data.get("_drivers_list_text")
+    if cached is None:
+        cached = data["_drivers_list_text"] = render_drivers_list(data)
+    return cached
+
+
+def invalidate_driver_caches(data: Dict[str, Any]) -> None:
+    data.pop("_drivers_list_text", None)
+    data.pop("_primary_driver", None)
+
+
+def render_drivers_list(data: Dict[str, Any]) -> str:
     drivers = data.get("drivers", {})
     if not drivers:
         return "No drivers added yet."
@@ -257,10 +770,12 @@ def get_total_base_weekly_all_drivers(data: Dict[str, Any]) -> float:
     return total
 
 
-def get_last_payment_for_driver(data: Dict[str, Any], driver_id: int) -> Optional[datetime]:
-    drv = get_driver_by_telegram_id(data, driver_id) or get_driver_by_any_id(data, driver_id)
-    if not drv:
-        return None
+def scan_last_payment_ts(drv: Dict[str, Any]) -> Optional[float]:
+    """
+    Full scan of drv['payments'] → latest payment as float epoch seconds (or None).
+    Microseconds are kept: a trip later in the same second is still unpaid.
+    Only used to backfill 'paid_up_to_ts' on load.
+    """
     last_dt = None
     for ts in drv.get("payments", []):
         try:
@@ -269,32 +784,58 @@ def get_last_payment_for_driver(data: Dict[str, Any], driver_id: int) -> Optiona
             continue
         if last_dt is None or dt > last_dt:
             last_dt = dt
-    return last_dt
+    return last_dt.timestamp() if last_dt else None
 
 
-# ---------- School days & week ranges ----------
+def get_last_payment_for_driver(data: Dict[str, Any], driver_id: int) -> Optional[datetime]:
+    drv = get_driver_by_telegram_id(data, driver_id) or get_driver_by_any_id(data, driver_id)
+    if not drv:
+        return None
+    ts = drv.get("paid_up_to_ts")
+    if ts is None:
+        return None
+    return dubai_datetime_from_ts(ts)
 
-def is_school_day(d: date) -> bool:
-    # Monday=0 .. Sunday=6
-    return d.weekday() < 5
 
+@functools.lru_cache(maxsize=256)
+def dubai_datetime_from_ts(ts: float) -> datetime:
+    # Few distinct checkpoints (one per /paydriver or /paid); datetimes are immutable
+    return datetime.fromtimestamp(ts, DUBAI_TZ)
 
-def school_days_between(start_d: date, end_d: date, no_school_dates: List[str]) -> Tuple[int, int]:
+
+# ---------- School days & week ranges ----------
+
+def weekdays_between(start_d: date, end_d: date) -> int:
+    """
+    Number of Mon–Fri days in [start_d, end_d], without walking day by day.
+    """
+    if end_d < start_d:
+        return 0
+    full_weeks, rem = divmod((end_d - start_d).days + 1, 7)
+    first = start_d.weekday()
+    return full_weeks * 5 + sum(1 for i in range(rem) if (first + i) % 7 < 5)
+
+
+def school_days_between(
+    start_d: date,
+    end_d: date,
+    ns_ranges: List[Tuple[date, date]],
+) -> Tuple[int, int]:
     """
     Returns (school_days, no_school_days) between [start_d, end_d].
+    ns_ranges is data['_no_school_ranges'] (sorted, non-overlapping).
     """
-    ns_set = set(no_school_dates)
-    school = 0
+    weekdays = weekdays_between(start_d, end_d)
+
+    # First range that can overlap: the last one starting on/before start_d
+    i = max(bisect.bisect_right(ns_ranges, start_d, key=lambda r: r[0]) - 1, 0)
+
     noschool = 0
-    cur = start_d
-    while cur <= end_d:
-        if is_school_day(cur):
-            if format_date(cur) in ns_set:
-                noschool += 1
-            else:
-                school += 1
-        cur += timedelta(days=1)
-    return school, noschool
+    for r_start, r_end in ns_ranges[i:]:
+        if r_start > end_d:
+            break
+        noschool += weekdays_between(max(r_start, start_d), min(r_end, end_d))
+    return weekdays - noschool, noschool
 
 
 def weekly_range_now(data: Dict[str, Any]) -> Tuple[Optional[datetime], datetime]:
@@ -306,14 +847,23 @@ def weekly_range_now(data: Dict[str, Any]) -> Tuple[Optional[datetime], datetime
     - If no week_start_date, use current calendar Monday.
     """
     now = now_dubai()
-    today = now.date()
+    week = week_bounds(data.get("week_start_date"), now.date())
+    if week is None:
+        return None, now
+    return week
+
 
-    floor_str = data.get("week_start_date")
+@functools.lru_cache(maxsize=32)
+def week_bounds(floor_str: Optional[str], today: date) -> Optional[Tuple[datetime, datetime]]:
+    """
+    Cached core of weekly_range_now: same answer for the whole day.
+    Returns None when week_start_date is still in the future.
+    """
     floor_date = parse_date_str(floor_str) if floor_str else None
 
     # If start date is in the future, no weekly report yet
     if floor_date and floor_date > today:
-        return None, now
+        return None
 
     if floor_date:
         days_diff = (today - floor_date).days
@@ -328,8 +878,8 @@ def weekly_range_now(data: Dict[str, Any]) -> Tuple[Optional[datetime], datetime
     if calc_end_date > today:
         calc_end_date = today
 
-    start_dt = datetime(week_start.year, week_start.month, week_start.day, 0, 0, tzinfo=DUBAI_TZ)
-    end_dt = datetime(calc_end_date.year, calc_end_date.month, calc_end_date.day, 23, 59, 59, tzinfo=DUBAI_TZ)
+    start_dt = datetime.combine(week_start, time.min, tzinfo=DUBAI_TZ)
+    end_dt = datetime.combine(calc_end_date, time(23, 59, 59), tzinfo=DUBAI_TZ)
     return start_dt, end_dt
 
 
@@ -341,12 +891,9 @@ def compute_weekly_totals(
     end_dt: datetime,
     driver_id: Optional[int] = None,
 ) -> Dict[str, Any]:
-    no_school_dates = data["no_school_dates"]
-    all_trips = data["trips"]
-
     start_d = start_dt.date()
     end_d = end_dt.date()
-    school_days, noschool_days = school_days_between(start_d, end_d, no_school_dates)
+    school_days, noschool_days = school_days_between(start_d, end_d, data["_no_school_ranges"])
 
     if driver_id is not None:
         # Per-driver base + payment
@@ -360,39 +907,38 @@ def compute_weekly_totals(
     base_per_day = base_weekly / SCHOOL_DAYS_PER_WEEK
     school_base_total = base_per_day * school_days
 
-    real_trips: List[Dict[str, Any]] = []
-    for t in all_trips:
-        try:
-            dt = parse_iso_datetime(t["date"]).astimezone(DUBAI_TZ)
-        except Exception:
-            continue
+    # Everything below compares float epoch seconds (trip "ts", driver "paid_up_to_ts")
+    # Whole days, like the date compares this replaced: [start day 00:00, day after end 00:00)
+    start_ts = datetime.combine(start_d, time.min, tzinfo=DUBAI_TZ).timestamp()
+    end_ts = datetime.combine(end_d + timedelta(days=1), time.min, tzinfo=DUBAI_TZ).timestamp()
+    paid_up_to = {d["id"]: d.get("paid_up_to_ts") for d in data["drivers"].values()}
+
+    # Single driver: only his trips. Admin global: every driver's trips
+    # (trips without a driver are skipped), each after its own driver's payment.
+    trips_by_driver = data["_real_trips_by_driver"]
+    ts_by_driver = data["_real_trip_ts_by_driver"]
+    amounts_by_driver = data["_real_trip_amount_by_driver"]
+    if driver_id is not None:
+        driver_ids = [driver_id]
+    else:
+        driver_ids = [did for did in trips_by_driver if did is not None]
 
-        d = dt.date()
-        if d < start_d or d > end_d:
-            continue
-        if t.get("is_test", False):
+    real_trips: List[Dict[str, Any]] = []
+    total_extra = 0.0
+    for did in driver_ids:
+        ts_list = ts_by_driver.get(did)
+        if not ts_list:
             continue
+        # Window on the driver's ts-sorted trips: from start and after the last payment, before end
+        lo = bisect.bisect_left(ts_list, start_ts)
+        lp_ts = paid_up_to.get(did)
+        if lp_ts is not None:
+            lo = max(lo, bisect.bisect_right(ts_list, lp_ts))
+        hi = bisect.bisect_left(ts_list, end_ts)
+        real_trips.extend(trips_by_driver[did][lo:hi])
+        total_extra += sum(amounts_by_driver[did][lo:hi])
+    real_trips.sort(key=lambda t: t["id"])  # callers rely on id order
 
-        trip_driver_id = t.get("driver_id")
-
-        if driver_id is not None:
-            # Single driver: filter by his ID and his own payments
-            if trip_driver_id != driver_id:
-                continue
-            lp = last_payment_ts
-            if lp and dt <= lp:
-                continue
-        else:
-            # Admin global: filter by each trip's own driver's payments
-            if trip_driver_id is None:
-                continue
-            lp = get_last_payment_for_driver(data, trip_driver_id)
-            if lp and dt <= lp:
-                continue
-
-        real_trips.append(t)
-
-    total_extra = sum(t["amount"] for t in real_trips)
     grand_total = school_base_total + total_extra
 
     return {
@@ -409,13 +955,43 @@ def compute_weekly_totals(
     }
 
 
+def extend_within_budget(
+    lines: List[str],
+    detail: Iterable[str],
+    count: int,
+    more_hint: str = " — use /export for all",
+) -> None:
+    """
+    Append detail lines until the text would pass REPORT_TEXT_BUDGET, then a
+    "... N more" note.
+    """
+    shown = take_within_budget(detail, sum(len(line) + 1 for line in lines))
+    lines.extend(shown)
+    if len(shown) < count:
+        lines.append(f"… {count - len(shown)} more trips not shown{more_hint}.")
+
+
+def take_within_budget(detail: Iterable[str], size: int) -> List[str]:
+    """
+    Lines from `detail` that fit in REPORT_TEXT_BUDGET next to `size` chars of
+    other text. `detail` is lazy, so lines past the cut are never built.
+    """
+    taken: List[str] = []
+    for line in detail:
+        size += len(line) + 1
+        if size > REPORT_TEXT_BUDGET:
+            break
+        taken.append(line)
+    return taken
+
+
 def format_period_header(start_dt: datetime) -> str:
     """
     For header label: always full week Monday–Friday.
     """
     week_start_d = start_dt.date()
     week_end_d = week_start_d + timedelta(days=4)
-    return f"Period: {week_start_d.strftime('%Y-%m-%d')} → {week_end_d.strftime('%Y-%m-%d')}"
+    return f"Period: {format_date(week_start_d)} → {format_date(week_end_d)}"
 
 
 def build_admin_weekly_report_text(data: Dict[str, Any], start_dt: datetime, end_dt: datetime) -> str:
@@ -461,15 +1037,21 @@ def build_admin_weekly_report_text(data: Dict[str, Any], start_dt: datetime, end
 
         lines.append("")
         lines.append("📋 Trip details:")
-        for t in sorted(totals["real_trips"], key=lambda x: x["id"]):
-            dt = parse_iso_datetime(t["date"]).astimezone(DUBAI_TZ)
-            d_str = dt.strftime("%Y-%m-%d")
-            drivers = data.get("drivers", {})
-            d = drivers.get(str(t.get("driver_id")))
-            d_name = d["name"] if d else f"Driver {t.get('driver_id','?')}"
-            lines.append(
-                f"- ID {t['id']}: {d_str} — {t['destination']} — {t['amount']:.2f} AED (driver: {d_name})"
-            )
+        drivers = data.get("drivers", {})
+        names: Dict[Any, str] = {}  # driver_id -> display name, looked up once per driver
+
+        def detail_lines():
+            for t in totals["real_trips"]:  # id-sorted by compute_weekly_totals
+                did = t.get("driver_id")
+                d_name = names.get(did)
+                if d_name is None:
+                    d = drivers.get(str(did))
+                    d_name = names[did] = d["name"] if d else f"Driver {t.get('driver_id', '?')}"
+                yield TRIP_LINE_DRIVER_FMT(
+                    id=t["id"], d=t["date"][:10], dest=t["destination"], amt=t["amount"], drv=d_name
+                )
+
+        extend_within_budget(lines, detail_lines(), len(totals["real_trips"]))
 
     return "\n".join(lines)
 
@@ -482,23 +1064,11 @@ def build_driver_weekly_report_text(data: Dict[str, Any], driver_telegram_id: in
     name = drv["name"] if drv else f"Driver {driver_telegram_id}"
     sid = drv.get("short_id") if drv else None
 
-    # From / until (since last payment for this driver)
+    # From / until (since last payment for this driver). Both are already
+    # Dubai-aware (week bounds, now_dubai(), dubai_datetime_from_ts), no astimezone needed.
     lp = totals["last_payment_ts"]
-    if lp is None:
-        from_dt = start_dt
-    else:
-        from_dt = lp
-
-    if from_dt.tzinfo is None:
-        from_dt = from_dt.replace(tzinfo=DUBAI_TZ)
-    else:
-        from_dt = from_dt.astimezone(DUBAI_TZ)
-
+    from_dt = start_dt if lp is None else lp
     until_dt = totals["end_ts"]
-    if until_dt.tzinfo is None:
-        until_dt = until_dt.replace(tzinfo=DUBAI_TZ)
-    else:
-        until_dt = until_dt.astimezone(DUBAI_TZ)
 
     fmt = "%d-%m-%Y %I:%M %p"
     from_str = from_dt.strftime(fmt)
@@ -529,60 +1099,138 @@ def build_driver_weekly_report_text(data: Dict[str, Any], driver_telegram_id: in
     if totals["real_trips"]:
         lines.append("")
         lines.append("📋 Trip details:")
-        for t in sorted(totals["real_trips"], key=lambda x: x["id"]):
-            dt = parse_iso_datetime(t["date"]).astimezone(DUBAI_TZ)
-            d_str = dt.strftime("%Y-%m-%d")
-            lines.append(
-                f"- ID {t['id']}: {d_str} — {t['destination']} — {t['amount']:.2f} AED"
-            )
+        extend_within_budget(
+            lines,
+            (
+                TRIP_LINE_FMT(id=t["id"], d=t["date"][:10], dest=t["destination"], amt=t["amount"])
+                for t in totals["real_trips"]  # id-sorted by compute_weekly_totals
+            ),
+            len(totals["real_trips"]),
+            more_hint="",  # drivers can't /export
+        )
 
     return "\n".join(lines)
 
 
+# ---------- Notifications ----------
+# One queue + worker task per chat: messages to a chat keep their order,
+# a slow or unreachable chat never delays the others, and handlers don't wait.
+
+TELEGRAM_MAX_MESSAGE_LEN = 4096
+NOTIFY_DEBOUNCE_SECONDS = 0.2  # messages queued within this window go out as one
+
+
+class RateLimiter:
+    """
+    Token bucket shared by all chat workers: at most `rate` sends per `per` seconds
+    (Telegram allows ~30 messages/second per bot).
+    """
+
+    def __init__(self, rate: int, per: float = 1.0) -> None:
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated: Optional[float] = None
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self.updated is not None:
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) * self.per / self.rate)
+
+
+NOTIFY_LIMITER = RateLimiter(rate=25, per=1.0)
+
+_CHAT_QUEUES: Dict[int, asyncio.Queue] = {}
+_CHAT_WORKERS: Dict[int, asyncio.Task] = {}
+
+
+def queue_message(bot: Bot, chat_id: int, text: str) -> None:
+    queue = _CHAT_QUEUES.get(chat_id)
+    if queue is None:
+        queue = _CHAT_QUEUES[chat_id] = asyncio.Queue()
+        _CHAT_WORKERS[chat_id] = asyncio.create_task(chat_worker(bot, chat_id, queue))
+    queue.put_nowait(text)
+
+
+async def chat_worker(bot: Bot, chat_id: int, queue: asyncio.Queue) -> None:
+    carry: Optional[str] = None  # didn't fit in the previous message
+    while True:
+        if carry is None:
+            first = await queue.get()
+            await asyncio.sleep(NOTIFY_DEBOUNCE_SECONDS)  # let a burst pile up
+        else:
+            first, carry = carry, None
+
+        batch = [first]
+        size = len(first)
+        while not queue.empty():
+            text = queue.get_nowait()
+            if size + 2 + len(text) > TELEGRAM_MAX_MESSAGE_LEN:
+                carry = text
+                break
+            batch.append(text)
+            size += 2 + len(text)
+
+        await NOTIFY_LIMITER.acquire()
+        try:
+            await bot.send_message(chat_id=chat_id, text="\n\n".join(batch))
+        except Exception:
+            pass
+
+
 # ---------- Keyboards ----------
+# Static per role, so built once at import and reused for every reply.
 
-def admin_main_keyboard() -> ReplyKeyboardMarkup:
-    keyboard = [
+ADMIN_MAIN_KEYBOARD = ReplyKeyboardMarkup(
+    [
         [KeyboardButton(BTN_ADD_TRIP), KeyboardButton(BTN_LIST_TRIPS)],
         [KeyboardButton(BTN_WEEKLY_REPORT), KeyboardButton(BTN_EXPORT_CSV)],
         [KeyboardButton(BTN_NOSCHOOL_MENU), KeyboardButton(BTN_DRIVERS_MENU)],
         [KeyboardButton(BTN_CLEAR_TRIPS), KeyboardButton(BTN_TOGGLE_TEST)],
         [KeyboardButton(BTN_PAID)],
-    ]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-
+    ],
+    resize_keyboard=True,
+)
 
-def noschool_keyboard() -> ReplyKeyboardMarkup:
-    keyboard = [
+NOSCHOOL_KEYBOARD = ReplyKeyboardMarkup(
+    [
         [KeyboardButton(BTN_NOSCHOOL_TODAY), KeyboardButton(BTN_NOSCHOOL_TOMORROW)],
         [KeyboardButton(BTN_NOSCHOOL_PICKDATE)],
         [KeyboardButton(BTN_BACK_MAIN)],
-    ]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-
+    ],
+    resize_keyboard=True,
+)
 
-def drivers_keyboard() -> ReplyKeyboardMarkup:
-    keyboard = [
+DRIVERS_KEYBOARD = ReplyKeyboardMarkup(
+    [
         [KeyboardButton(BTN_DRIVERS_LIST)],
         [KeyboardButton(BTN_DRIVERS_ADD), KeyboardButton(BTN_DRIVERS_REMOVE)],
         [KeyboardButton(BTN_DRIVERS_SET_PRIMARY)],
         [KeyboardButton(BTN_BACK_MAIN)],
-    ]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-
+    ],
+    resize_keyboard=True,
+)
 
-def driver_keyboard() -> ReplyKeyboardMarkup:
-    keyboard = [
+DRIVER_KEYBOARD = ReplyKeyboardMarkup(
+    [
         [KeyboardButton(BTN_DRIVER_MY_WEEK)],
         [KeyboardButton(BTN_DRIVER_MY_REPORT)],
-    ]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    ],
+    resize_keyboard=True,
+)
 
 
 # ---------- Commands ----------
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    data = load_data()
+    data = await load_update_data(update, context)
     user = update.effective_user
     chat = update.effective_chat
     if not user or not chat:
@@ -593,7 +1241,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if is_admin(uid):
         if chat.id not in data["admin_chats"]:
             data["admin_chats"].append(chat.id)
-            save_data(data)
+            await save_data_now(data)
         msg = (
             "👋 DriverSchoolBot 3.0 — Admin\n\n"
             "Use /menu or the buttons.\n\n"
@@ -605,6 +1253,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             "• /trip <amount> <destination>\n"
             "• /tripfor <driver_code> <amount> <destination>\n"
             "• /report (weekly, all drivers)\n"
+            "• /list [skip] (latest trips; skip N newest to page back)\n"
             "• /paydriver <driver_code> (close trips for one driver)\n"
             "• /paid (close trips for ALL drivers)\n"
             "• /listunpaid <driver_code> (unpaid trips for one driver)\n"
@@ -614,7 +1263,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             "Note: driver_code can be Telegram ID or SID.\n"
         )
         if update.message:
-            await update.message.reply_text(msg, reply_markup=admin_main_keyboard())
+            await update.message.reply_text(msg, reply_markup=ADMIN_MAIN_KEYBOARD)
         return
 
     # Driver
@@ -629,7 +1278,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             "• \"🧾 My Weekly Report\" – full details\n"
         )
         if update.message:
-            await update.message.reply_text(msg, reply_markup=driver_keyboard())
+            await update.message.reply_text(msg, reply_markup=DRIVER_KEYBOARD)
         return
 
     # Not authorized
@@ -638,17 +1287,17 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 async def menu_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    data = load_data()
     user = update.effective_user
     if not user:
         return
     uid = user.id
 
-    if is_admin(uid):
+    if is_admin(uid):  # static keyboard, no data needed
         if update.message:
-            await update.message.reply_text("👨‍💼 Admin menu:", reply_markup=admin_main_keyboard())
+            await update.message.reply_text("👨‍💼 Admin menu:", reply_markup=ADMIN_MAIN_KEYBOARD)
         return
 
+    data = await load_update_data(update, context)
     if is_driver_user(data, uid):
         d = data["drivers"].get(str(uid))
         name = d["name"] if d else "driver"
@@ -656,7 +1305,7 @@ async def menu_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         if update.message:
             await update.message.reply_text(
                 f"🚕 Driver menu — {name} (SID: {sid}):",
-                reply_markup=driver_keyboard(),
+                reply_markup=DRIVER_KEYBOARD,
             )
         return
 
@@ -677,9 +1326,9 @@ async def setbase_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     except ValueError:
         await update.message.reply_text("Amount must be a positive number.")
         return
-    data = load_data()
+    data = await load_update_data(update, context)
     data["base_weekly"] = amount
-    save_data(data)
+    await save_data_now(data)
     await update.message.reply_text(f"✅ Global weekly base (default) updated to {amount:.2f} AED")
 
 
@@ -694,9 +1343,9 @@ async def setweekstart_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     except Exception:
         await update.message.reply_text("Invalid date. Use YYYY-MM-DD.")
         return
-    data = load_data()
+    data = await load_update_data(update, context)
     data["week_start_date"] = format_date(d)
-    save_data(data)
+    await save_data_now(data)
     await update.message.reply_text(f"✅ Weekly calculations start from {format_date(d)}.")
 
 
@@ -713,7 +1362,7 @@ async def adddriver_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         return
 
     name = " ".join(context.args[1:])
-    data = load_data()
+    data = await load_update_data(update, context)
     drivers = data["drivers"]
 
     first_driver = len(drivers) == 0
@@ -728,7 +1377,9 @@ async def adddriver_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         "base_weekly": None,  # uses global default until you setdriverbase
         "payments": [],
     }
-    save_data(data)
+    build_sid_index(data)
+    invalidate_driver_caches(data)
+    await save_data_now(data)
 
     flag = " (primary)" if first_driver else ""
     await update.message.reply_text(
@@ -742,10 +1393,7 @@ async def adddriver_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         "Your short ID (SID) is "
         f"{short_id}. Use /start to open your driver menu and see your weekly report."
     )
-    try:
-        await context.bot.send_message(chat_id=telegram_id, text=welcome_msg)
-    except Exception:
-        pass
+    queue_message(context.bot, telegram_id, welcome_msg)
 
 
 async def setdriverbase_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -767,14 +1415,15 @@ async def setdriverbase_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("Driver code and amount must be numbers, amount > 0.")
         return
 
-    data = load_data()
+    data = await load_update_data(update, context)
     drv = get_driver_by_any_id(data, code)
     if not drv:
         await update.message.reply_text("Driver not found by this code.")
         return
 
     drv["base_weekly"] = amount
-    save_data(data)
+    invalidate_driver_caches(data)
+    await save_data_now(data)
     await update.message.reply_text(
         f"✅ Weekly base for driver {drv['name']} (ID: {drv['id']}, SID: {drv['short_id']}) "
         f"set to {amount:.2f} AED"
@@ -796,7 +1445,7 @@ async def removedriver_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         await update.message.reply_text("Driver code must be a number (ID or SID).")
         return
 
-    data = load_data()
+    data = await load_update_data(update, context)
     drivers = data["drivers"]
     drv = get_driver_by_any_id(data, code)
     if not drv:
@@ -808,7 +1457,10 @@ async def removedriver_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     # remove by telegram id key
     if str(tid) in drivers:
         del drivers[str(tid)]
-    save_data(data)
+    build_sid_index(data)
+    invalidate_driver_caches(data)
+    await run_file_io(write_payments, payment_records(drivers))
+    await save_data_now(data)
     await update.message.reply_text(f"🗑 Driver removed: {name} (ID: {tid}, SID: {drv.get('short_id')})")
 
 
@@ -827,7 +1479,7 @@ async def setprimarydriver_cmd(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text("Driver code must be a number (ID or SID).")
         return
 
-    data = load_data()
+    data = await load_update_data(update, context)
     drv = get_driver_by_any_id(data, code)
     if not drv:
         await update.message.reply_text("Driver not found.")
@@ -837,7 +1489,8 @@ async def setprimarydriver_cmd(update: Update, context: ContextTypes.DEFAULT_TYP
     for d in drivers.values():
         d["is_primary"] = False
     drv["is_primary"] = True
-    save_data(data)
+    invalidate_driver_caches(data)
+    await save_data_now(data)
     await update.message.reply_text(
         f"⭐ Primary driver set to {drv['name']} (ID: {drv['id']}, SID: {drv['short_id']})"
     )
@@ -846,7 +1499,7 @@ async def setprimarydriver_cmd(update: Update, context: ContextTypes.DEFAULT_TYP
 async def drivers_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not await ensure_admin(update):
         return
-    data = load_data()
+    data = await load_update_data(update, context)
     txt = drivers_list_text(data)
     await update.message.reply_text(txt)
 
@@ -858,7 +1511,7 @@ async def add_trip_common(
     destination: str,
     driver: Dict[str, Any],
 ) -> None:
-    data = load_data()
+    data = await load_update_data(update, context)
     now = now_dubai()
     trip_id = data["next_trip_id"]
     data["next_trip_id"] += 1
@@ -875,11 +1528,14 @@ async def add_trip_common(
         "driver_id": driver["id"],
         "driver_name": driver["name"],
         "is_test": is_test,
+        "ts": now.timestamp(),
     }
     data["trips"].append(trip)
-    save_data(data)
+    index_trip(data, trip)
+    await run_file_io(append_trip, trip)
+    await save_data_async(data)
 
-    pretty = now.strftime("%Y-%m-%d %H:%M")
+    pretty = format_minute(now)
     test_label = "🧪 [TEST] " if is_test else ""
     if update.message:
         await update.message.reply_text(
@@ -902,11 +1558,12 @@ async def add_trip_common(
             f"👤 Added by Telegram ID: {trip['user_id']}\n"
             f"🚗 For driver: {driver['name']} (ID: {driver['id']}, SID: {driver.get('short_id')})"
         )
+        # The chat that added the trip already got the "Trip added" reply above
+        chat = update.effective_chat
+        added_in = chat.id if chat and update.message else None
         for chat_id in data.get("admin_chats", []):
-            try:
-                await context.bot.send_message(chat_id=chat_id, text=admin_msg)
-            except Exception:
-                continue
+            if chat_id != added_in:
+                queue_message(context.bot, chat_id, admin_msg)
 
         # Notify driver
         driver_msg = (
@@ -917,10 +1574,7 @@ async def add_trip_common(
             f"💰 {amount:.2f} AED\n"
             f"👤 Recorded by: {trip['user_name'] or trip['user_id']}"
         )
-        try:
-            await context.bot.send_message(chat_id=driver["id"], text=driver_msg)
-        except Exception:
-            pass
+        queue_message(context.bot, driver["id"], driver_msg)
 
 
 async def trip_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -939,7 +1593,7 @@ async def trip_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("Amount must be a positive number.")
         return
     destination = " ".join(context.args[1:])
-    data = load_data()
+    data = await load_update_data(update, context)
     driver = get_primary_driver(data)
     if not driver:
         await update.message.reply_text("No driver found. Use /adddriver first.")
@@ -971,7 +1625,7 @@ async def tripfor_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         return
 
     destination = " ".join(context.args[2:])
-    data = load_data()
+    data = await load_update_data(update, context)
     driver = get_driver_by_any_id(data, code)
     if not driver or not driver.get("active", True):
         await update.message.reply_text("Driver not found or inactive.")
@@ -980,34 +1634,60 @@ async def tripfor_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
 
 async def list_trips_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    /list [skip] — the latest trips that fit in one message, skipping the
+    `skip` newest ones; the reply says which /list shows the page before.
+    Totals always cover all trips.
+    """
     if not await ensure_admin(update):
         return
-    data = load_data()
+    skip = 0
+    if context.args:
+        try:
+            skip = max(0, int(context.args[0]))
+        except ValueError:
+            await update.message.reply_text("Usage: /list [skip]  (e.g. /list 50 for older trips)")
+            return
+    data = await load_update_data(update, context)
     trips = data["trips"]
     if not trips:
         await update.message.reply_text("No trips recorded yet.")
         return
-    real_total = 0.0
-    test_total = 0.0
-    lines = ["📋 All trips (REAL + TEST):"]
-    for t in sorted(trips, key=lambda x: x["id"]):
-        dt = parse_iso_datetime(t["date"]).astimezone(DUBAI_TZ)
-        d_str = dt.strftime("%Y-%m-%d")
-        test_flag = t.get("is_test", False)
-        tag = " 🧪[TEST]" if test_flag else ""
-        if test_flag:
-            test_total += t["amount"]
-        else:
-            real_total += t["amount"]
+    end = max(0, len(trips) - skip)
+    if end == 0:
+        await update.message.reply_text(f"ℹ️ Only {len(trips)} trips recorded, nothing that old.")
+        return
+
+    def trip_line(t: Dict[str, Any]) -> str:
+        d_str = t["date"][:10]  # stored as Dubai-local ISO, no need to parse
+        tag = " 🧪[TEST]" if t.get("is_test", False) else ""
         driver_name = t.get("driver_name") or f"Driver {t.get('driver_id','?')}"
         by = t.get("user_name") or f"ID {t.get('user_id','?')}"
-        lines.append(
+        return (
             f"- ID {t['id']}: {d_str} — {t['destination']} — {t['amount']:.2f} AED{tag} "
             f"(by {by}, driver: {driver_name})"
         )
-    lines.append("")
-    lines.append(f"💰 REAL trips total: {real_total:.2f} AED")
-    lines.append(f"🧪 TEST trips total (ignored in weekly totals): {test_total:.2f} AED")
+
+    footer = [
+        "",
+        f"💰 REAL trips total: {data['_real_total']:.2f} AED",
+        f"🧪 TEST trips total (ignored in weekly totals): {data['_test_total']:.2f} AED",
+    ]
+    # Newest first until the budget runs out; 80 chars covers the header and hint.
+    page = take_within_budget(
+        (trip_line(trips[i]) for i in range(end - 1, -1, -1)),
+        sum(len(line) + 1 for line in footer) + 80,
+    )
+    if not page:  # a single trip longer than the budget (huge destination)
+        line = trip_line(trips[end - 1])
+        page = [line[: REPORT_TEXT_BUDGET - 400] + "…"]
+    page.reverse()
+    start_i = end - len(page)
+    lines = [f"📋 Trips {start_i + 1}–{end} of {len(trips)} (REAL + TEST):"]
+    if start_i > 0:
+        lines.append(f"Older trips: /list {skip + len(page)}")
+    lines.extend(page)
+    lines.extend(footer)
     await update.message.reply_text("\n".join(lines))
 
 
@@ -1028,37 +1708,26 @@ async def listunpaid_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await update.message.reply_text("Driver code must be a number (ID or SID).")
         return
 
-    data = load_data()
+    data = await load_update_data(update, context)
     drv = get_driver_by_any_id(data, code)
     if not drv:
         await update.message.reply_text("Driver not found.")
         return
 
     driver_id = drv["id"]
-    last_payment_ts = get_last_payment_for_driver(data, driver_id)
-    week_start_str = data.get("week_start_date")
-    floor_date = parse_date_str(week_start_str) if week_start_str else None
-
-    trips = data.get("trips", [])
-    unpaid: List[Dict[str, Any]] = []
-    for t in trips:
-        if t.get("is_test", False):
-            continue
-        if t.get("driver_id") != driver_id:
-            continue
-        try:
-            dt = parse_iso_datetime(t["date"]).astimezone(DUBAI_TZ)
-        except Exception:
-            continue
 
-        # Respect week_start_date as minimum date
-        if floor_date and dt.date() < floor_date:
-            continue
-
-        if last_payment_ts and dt <= last_payment_ts:
-            continue
-
-        unpaid.append(t)
+    # Skip trips up to the later of: last payment, start of week_start_date
+    trips = data["_real_trips_by_driver"].get(driver_id, [])
+    ts_list = data["_real_trip_ts_by_driver"].get(driver_id, [])
+    lo = 0
+    week_start_str = data.get("week_start_date")
+    if week_start_str:
+        floor_dt = datetime.combine(parse_date_str(week_start_str), time.min, tzinfo=DUBAI_TZ)
+        lo = bisect.bisect_left(ts_list, floor_dt.timestamp())
+    cutoff = drv.get("paid_up_to_ts")
+    if cutoff is not None:
+        lo = max(lo, bisect.bisect_right(ts_list, cutoff))
+    unpaid = trips[lo:]
 
     if not unpaid:
         await update.message.reply_text(
@@ -1071,12 +1740,14 @@ async def listunpaid_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         f"📋 Unpaid trips for {drv['name']} (ID: {drv['id']}, SID: {drv['short_id']}):",
         "",
     ]
-    for t in sorted(unpaid, key=lambda x: x["id"]):
-        dt = parse_iso_datetime(t["date"]).astimezone(DUBAI_TZ)
-        d_str = dt.strftime("%Y-%m-%d %H:%M")
-        lines.append(
-            f"- ID {t['id']}: {d_str} — {t['destination']} — {t['amount']:.2f} AED"
-        )
+    extend_within_budget(
+        lines,
+        (
+            TRIP_LINE_FMT(id=t["id"], d=t["date"][:16].replace("T", " "), dest=t["destination"], amt=t["amount"])
+            for t in sorted(unpaid, key=lambda x: x["id"])
+        ),
+        len(unpaid),
+    )
     lines.append("")
     lines.append(f"💰 Total unpaid: {total:.2f} AED")
 
@@ -1089,7 +1760,7 @@ async def report_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     """
     if not await ensure_admin(update):
         return
-    data = load_data()
+    data = await load_update_data(update, context)
     start_dt, end_dt = weekly_range_now(data)
     if start_dt is None:
         wd = data.get("week_start_date")
@@ -1103,7 +1774,7 @@ async def driver_week_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """
     Driver weekly report when driver clicks "My Week" or "My Weekly Report".
     """
-    data = load_data()
+    data = await load_update_data(update, context)
     user = update.effective_user
     if not user:
         return
@@ -1136,18 +1807,21 @@ async def paydriver_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         await update.message.reply_text("Driver code must be a number (ID or SID).")
         return
 
-    data = load_data()
+    data = await load_update_data(update, context)
     drv = get_driver_by_any_id(data, code)
     if not drv:
         await update.message.reply_text("Driver not found.")
         return
 
     now = now_dubai()
+    now_iso = now.isoformat()
+    now_ts = now.timestamp()
     drv.setdefault("payments", [])
-    drv["payments"].append(now.isoformat())
-    save_data(data)
+    drv["payments"].append(now_iso)
+    drv["paid_up_to_ts"] = now_ts
+    await run_file_io(append_payments, [{"d": drv["id"], "t": now_iso, "ts": now_ts}])
 
-    pretty = now.strftime("%Y-%m-%d %H:%M")
+    pretty = format_minute(now)
     await update.message.reply_text(
         f"💸 Payment checkpoint for {drv['name']} "
         f"(ID: {drv['id']}, SID: {drv['short_id']}) saved at {pretty}.\n"
@@ -1161,14 +1835,19 @@ async def paid_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     if not await ensure_admin(update):
         return
-    data = load_data()
+    data = await load_update_data(update, context)
     now = now_dubai()
+    now_iso = now.isoformat()
+    now_ts = now.timestamp()
     drivers = data.get("drivers", {})
+    records = []
     for drv in drivers.values():
         drv.setdefault("payments", [])
-        drv["payments"].append(now.isoformat())
-    save_data(data)
-    pretty = now.strftime("%Y-%m-%d %H:%M")
+        drv["payments"].append(now_iso)
+        drv["paid_up_to_ts"] = now_ts
+        records.append({"d": drv["id"], "t": now_iso, "ts": now_ts})
+    await run_file_io(append_payments, records)
+    pretty = format_minute(now)
     await update.message.reply_text(
         f"💸 Payment checkpoint saved for ALL drivers at {pretty}.\n"
         f"Next weekly reports will count trips after this time for each driver."
@@ -1178,27 +1857,34 @@ async def paid_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 async def export_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not await ensure_admin(update):
         return
-    data = load_data()
+    data = await load_update_data(update, context)
     trips = data["trips"]
     if not trips:
         await update.message.reply_text("No trips to export.")
         return
     filename = "driver_trips_export.csv"
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write("id,date,amount,destination,user_id,user_name,driver_id,driver_name,is_test\n")
-        for t in sorted(trips, key=lambda x: x["id"]):
-            f.write(
-                f"{t['id']},{t['date']},{t['amount']},"
-                f"\"{t['destination'].replace('\"','\"\"')}\","
-                f"{t.get('user_id','')},"
-                f"\"{(t.get('user_name') or '').replace('\"','\"\"')}\","
-                f"{t.get('driver_id','')},"
-                f"\"{(t.get('driver_name') or '').replace('\"','\"\"')}\","
-                f"{1 if t.get('is_test', False) else 0}\n"
-            )
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(
+        ["id", "date", "amount", "destination", "user_id", "user_name", "driver_id", "driver_name", "is_test"]
+    )
+    writer.writerows(
+        (
+            t["id"],
+            t["date"],
+            t["amount"],
+            t["destination"],
+            t.get("user_id", ""),
+            t.get("user_name") or "",
+            t.get("driver_id", ""),
+            t.get("driver_name") or "",
+            1 if t.get("is_test", False) else 0,
+        )
+        for t in trips  # already id-sorted
+    )
+    # Upload from memory; no temp file on disk
     await update.message.reply_document(
-        document=InputFile(filename),
-        filename=filename,
+        document=InputFile(buf.getvalue().encode("utf-8"), filename=filename),
         caption="📄 All trips exported as CSV (REAL + TEST).",
     )
 
@@ -1206,20 +1892,22 @@ async def export_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
 async def cleartrips_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not await ensure_admin(update):
         return
-    data = load_data()
+    data = await load_update_data(update, context)
     count = len(data["trips"])
     data["trips"] = []
     data["next_trip_id"] = 1
-    save_data(data)
+    build_trip_indexes(data)
+    await run_file_io(write_trips, [])
+    await save_data_now(data)
     await update.message.reply_text(f"🧹 Cleared all trips. Removed {count} records.")
 
 
 async def test_on_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not await ensure_admin(update):
         return
-    data = load_data()
+    data = await load_update_data(update, context)
     data["test_mode"] = True
-    save_data(data)
+    await save_data_now(data)
     await update.message.reply_text(
         "🧪 Test Mode is ON. New trips will be marked as TEST and ignored in weekly totals."
     )
@@ -1228,9 +1916,9 @@ async def test_on_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 async def test_off_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not await ensure_admin(update):
         return
-    data = load_data()
+    data = await load_update_data(update, context)
     data["test_mode"] = False
-    save_data(data)
+    await save_data_now(data)
     await update.message.reply_text(
         "✅ Test Mode is OFF. New trips will be REAL and counted in all reports."
     )
@@ -1242,7 +1930,7 @@ async def noschool_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     if not await ensure_admin(update):
         return
 
-    data = load_data()
+    data = await load_update_data(update, context)
 
     if context.args:
         arg = context.args[0].lower()
@@ -1261,10 +1949,11 @@ async def noschool_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             return
 
     d_str = format_date(d)
-    if d_str not in data["no_school_dates"]:
-        data["no_school_dates"].append(d_str)
-        data["no_school_dates"].sort()
-        save_data(data)
+    if d not in data["_no_school_set"]:
+        bisect.insort(data["no_school_dates"], d_str)  # list stays sorted
+        data["_no_school_set"] = data["_no_school_set"] | {d}
+        refresh_no_school_ranges(data)
+        await save_data_now(data)
         await update.message.reply_text(f"✅ Marked {d_str} as no-school day.")
     else:
         await update.message.reply_text(f"ℹ️ {d_str} is already no-school.")
@@ -1274,10 +1963,7 @@ async def noschool_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     if drivers:
         msg = f"🏫 No school on {d_str}. No pickup needed that day."
         for drv in drivers:
-            try:
-                await context.bot.send_message(chat_id=drv["id"], text=msg)
-            except Exception:
-                continue
+            queue_message(context.bot, drv["id"], msg)
 
 
 async def removeschool_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1297,10 +1983,12 @@ async def removeschool_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         return
 
     d_str = format_date(d)
-    data = load_data()
-    if d_str in data["no_school_dates"]:
+    data = await load_update_data(update, context)
+    if d in data["_no_school_set"]:
         data["no_school_dates"] = [x for x in data["no_school_dates"] if x != d_str]
-        save_data(data)
+        data["_no_school_set"] = data["_no_school_set"] - {d}
+        refresh_no_school_ranges(data)
+        await save_data_now(data)
         await update.message.reply_text(f"✅ {d_str} removed from no-school dates.")
     else:
         await update.message.reply_text(f"ℹ️ {d_str} was not in no-school dates.")
@@ -1314,7 +2002,7 @@ async def clearnoschool_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if not await ensure_admin(update):
         return
 
-    data = load_data()
+    data = await load_update_data(update, context)
     existing = data.get("no_school_dates", [])
     if not existing:
         await update.message.reply_text("ℹ️ There are no no-school dates to clear.")
@@ -1322,7 +2010,9 @@ async def clearnoschool_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     count = len(existing)
     data["no_school_dates"] = []
-    save_data(data)
+    data["_no_school_set"] = frozenset()
+    data["_no_school_ranges"] = []
+    await save_data_now(data)
 
     await update.message.reply_text(f"✅ All no-school dates cleared. ({count} days removed)")
 
@@ -1334,20 +2024,43 @@ async def clearnoschool_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE)
             "🚗 Please follow the normal school schedule."
         )
         for drv in drivers:
-            try:
-                await context.bot.send_message(chat_id=drv["id"], text=msg)
-            except Exception:
-                continue
+            queue_message(context.bot, drv["id"], msg)
 
 
 # ---------- Menu handlers ----------
 
+# Buttons that map straight onto a command handler.
+_ADMIN_BTN_DISPATCH = {
+    BTN_LIST_TRIPS: list_trips_cmd,
+    BTN_WEEKLY_REPORT: report_cmd,
+    BTN_EXPORT_CSV: export_cmd,
+    BTN_CLEAR_TRIPS: cleartrips_cmd,
+    BTN_PAID: paid_cmd,
+}
+
+# Driver keyboard buttons (both show the driver's own week)
+_DRIVER_BTN_DISPATCH = {
+    BTN_DRIVER_MY_WEEK: driver_week_cmd,
+    BTN_DRIVER_MY_REPORT: driver_week_cmd,
+}
+
+# Buttons that only answer with fixed text (and maybe a keyboard).
+_ADMIN_BTN_REPLIES: Dict[str, Tuple[str, Optional[ReplyKeyboardMarkup]]] = {
+    BTN_ADD_TRIP: ("Use /trip <amount> <destination>\nOr type: \"70 Dubai Mall\"", None),
+    BTN_DRIVERS_MENU: ("🚕 Drivers:", DRIVERS_KEYBOARD),
+    BTN_DRIVERS_ADD: ("Use /adddriver <telegram_id> <name>", None),
+    BTN_DRIVERS_REMOVE: ("Use /removedriver <driver_code> (ID or SID)", None),
+    BTN_DRIVERS_SET_PRIMARY: ("Use /setprimarydriver <driver_code> (ID or SID)", None),
+    BTN_NOSCHOOL_MENU: ("🏫 No School:", NOSCHOOL_KEYBOARD),
+    BTN_BACK_MAIN: ("Back to main menu.", ADMIN_MAIN_KEYBOARD),
+}
+
+
 async def admin_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Handle admin text buttons & quick trip (e.g., '70 Dubai Mall'),
     and no-school pick date input.
     """
-    data = load_data()
     user = update.effective_user
     chat = update.effective_chat
     if not user or not is_admin(user.id):
@@ -1355,6 +2068,24 @@ async def admin_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     txt = (update.message.text or "").strip()
 
+    # Back cancels a pending Pick Date; otherwise every later message is read as a date
+    if txt == BTN_BACK_MAIN and chat:
+        data = await load_update_data(update, context)
+        if chat.id in data["awaiting_noschool_date"]:
+            data["awaiting_noschool_date"] = [
+                cid for cid in data["awaiting_noschool_date"] if cid != chat.id
+            ]
+            await save_data_now(data)
+
+    # Fixed-text / navigation buttons need no data (and work while a date is awaited)
+    reply = _ADMIN_BTN_REPLIES.get(txt)
+    if reply:
+        reply_text, keyboard = reply
+        await update.message.reply_text(reply_text, reply_markup=keyboard)
+        return
+
+    data = await load_update_data(update, context)
+
     # Are we waiting for a no-school date from this admin?
     if chat and chat.id in data.get("awaiting_noschool_date", []):
         try:
@@ -1367,31 +2098,18 @@ async def admin_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         data["awaiting_noschool_date"] = [
             cid for cid in data["awaiting_noschool_date"] if cid != chat.id
         ]
-        save_data(data)
+        await save_data_now(data)
 
         context.args = [format_date(d)]
         await noschool_cmd(update, context)
 
-        await update.message.reply_text("Back to main No School menu.", reply_markup=noschool_keyboard())
+        await update.message.reply_text("Back to main No School menu.", reply_markup=NOSCHOOL_KEYBOARD)
         return
 
     # Buttons
-    if txt == BTN_ADD_TRIP:
-        await update.message.reply_text(
-            "Use /trip <amount> <destination>\nOr type: \"70 Dubai Mall\""
-        )
-        return
-    if txt == BTN_LIST_TRIPS:
-        await list_trips_cmd(update, context)
-        return
-    if txt == BTN_WEEKLY_REPORT:
-        await report_cmd(update, context)
-        return
-    if txt == BTN_EXPORT_CSV:
-        await export_cmd(update, context)
-        return
-    if txt == BTN_CLEAR_TRIPS:
-        await cleartrips_cmd(update, context)
+    fn = _ADMIN_BTN_DISPATCH.get(txt)
+    if fn:
+        await fn(update, context)
         return
     if txt == BTN_TOGGLE_TEST:
         if data.get("test_mode", False):
@@ -1399,50 +2117,24 @@ async def admin_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         else:
             await test_on_cmd(update, context)
         return
-    if txt == BTN_DRIVERS_MENU:
-        await update.message.reply_text("🚕 Drivers:", reply_markup=drivers_keyboard())
-        return
     if txt == BTN_DRIVERS_LIST:
         await update.message.reply_text(drivers_list_text(data))
         return
-    if txt == BTN_DRIVERS_ADD:
-        await update.message.reply_text("Use /adddriver <telegram_id> <name>")
-        return
-    if txt == BTN_DRIVERS_REMOVE:
-        await update.message.reply_text("Use /removedriver <driver_code> (ID or SID)")
-        return
-    if txt == BTN_DRIVERS_SET_PRIMARY:
-        await update.message.reply_text("Use /setprimarydriver <driver_code> (ID or SID)")
-        return
-    if txt == BTN_NOSCHOOL_MENU:
-        await update.message.reply_text("🏫 No School:", reply_markup=noschool_keyboard())
-        return
-    if txt == BTN_NOSCHOOL_TODAY:
-        context.args = ["today"]
-        await noschool_cmd(update, context)
-        return
-    if txt == BTN_NOSCHOOL_TOMORROW:
-        context.args = ["tomorrow"]
+    if txt in (BTN_NOSCHOOL_TODAY, BTN_NOSCHOOL_TOMORROW):
+        context.args = ["today" if txt == BTN_NOSCHOOL_TODAY else "tomorrow"]
         await noschool_cmd(update, context)
         return
     if txt == BTN_NOSCHOOL_PICKDATE:
         if chat and chat.id not in data["awaiting_noschool_date"]:
             data["awaiting_noschool_date"].append(chat.id)
-            save_data(data)
+            await save_data_now(data)
         await update.message.reply_text(
             "📅 Send the date as YYYY-MM-DD for no school.\nExample: 2025-12-02"
         )
         return
-    if txt == BTN_BACK_MAIN:
-        await update.message.reply_text("Back to main menu.", reply_markup=admin_main_keyboard())
-        return
-    if txt == BTN_PAID:
-        await paid_cmd(update, context)
-        return
 
     # Quick trip: "70 dubai mall"
-    import re as _re
-    m = _re.match(r"^\s*(\d+(?:\.\d+)?)\s+(.+)$", txt)
+    m = QUICK_TRIP_RE.match(txt)
     if m:
         try:
             amount = float(m.group(1))
@@ -1458,22 +2150,27 @@ async def admin_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 
 async def driver_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    data = load_data()
+    data = await load_update_data(update, context)
     user = update.effective_user
     if not user or not is_driver_user(data, user.id):
         return
-    txt = (update.message.text or "").strip()
-    if txt in (BTN_DRIVER_MY_WEEK, BTN_DRIVER_MY_REPORT):
-        await driver_week_cmd(update, context)
+    fn = _DRIVER_BTN_DISPATCH.get((update.message.text or "").strip())
+    if fn:
+        await fn(update, context)
 
 # ---------- Main ----------
 
+async def on_shutdown(app: Application) -> None:
+    # Write out a pending debounced save before the process exits
+    await flush_data()
+
+
 def main() -> None:
     token = os.getenv("BOT_TOKEN")
     if not token:
         raise RuntimeError("Please set BOT_TOKEN environment variable.")
 
-    app = Application.builder().token(token).build()
+    app = Application.builder().token(token).post_shutdown(on_shutdown).build()
 
     # Commands
     app.add_handler(CommandHandler("start", start))